@@ -5,6 +5,8 @@
 # @ Boolean(label='allow Originals', value=True) allow_orig
 # @ Integer(label='Measurements / Image', value=2) measurements
 # @ Boolean(label='Export Results', value=False) do_export
+# @ Boolean(label='Batch mode (saved ROIs)', value=False) do_batch
+# @ Integer(label='Bio-Formats buffer size', value=8192) buffer_size
 
 """autoJ - ROI measurement in an image set
 
@@ -45,21 +47,31 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see https://www.gnu.org/licenses/lgpl-3.0.
 """
 
-# TODO:
-#  - add csv export via results:
-#  https://syn.mrc-lmb.cam.ac.uk/acardona/fiji-tutorial/#measurements-results-table
-
 import os
+import re
+from collections import deque
 # java imports
-from java.io import File
+from java.io import (BufferedWriter, ByteArrayInputStream, File,
+                     FileWriter, IOException)
+from java.lang import (Integer, NoSuchFieldException, SecurityException,
+                       System, Thread)
+from java.nio.file import (Files, Paths, FileVisitOption, FileVisitResult,
+                           SimpleFileVisitor)
+from java.util import EnumSet
+from java.util.concurrent import Callable, Executors, ThreadFactory
 from javax.swing import JFrame, JButton, JOptionPane
 from java.awt.event import ActionListener
 # ImageJ imports
 from ij import IJ, WindowManager as WM
 from ij.gui import GenericDialog, WaitForUserDialog
+from ij.io import Opener
+from ij.macro import Interpreter
+from ij.measure import ResultsTable
+from ij.plugin.frame import RoiManager
 
 
-def filter_directory(path, file_type=None, name_filter=None):
+def filter_directory(path, file_type=None, name_filter=None, recursive=True,
+                     follow_links=True):
     """Creates a list of all criteria matching files in the given folder.
 
     :param path:        The path from were to open the images.
@@ -68,119 +80,519 @@ def filter_directory(path, file_type=None, name_filter=None):
                         (default: None).
     :param name_filter: Only accept files that contain the given string
                         (default: None).
+    :param recursive:   Also search all sub directories (default: True).
+    :param follow_links: Also search symbolic links to directories, each
+                        directory is visited only once (default: True).
     """
-    # string and strip user inputs
-    file_type = split_string(file_type)
-    name_filter = split_string(name_filter)
+    return list(_iter_matching(path, file_type, name_filter, recursive,
+                               follow_links))
+
 
+def _iter_matching(path, file_type=None, name_filter=None, recursive=True,
+                   follow_links=True):
+    """Yields all criteria matching files in the given folder, only these
+    are kept during the traversal. See filter_directory for the arguments.
+    """
+    entries = _iter_files(_canon_path(path), recursive, follow_links,
+                          _file_suffixes(file_type),
+                          _make_filter_check(name_filter))
+    for entry in entries:
+        yield entry.path
+
+
+def filter_directory_multi(path, file_type=None, name_filters=(None,),
+                           recursive=True, follow_links=True):
+    """Creates one list of matching files per name filter, while the folder
+    is only traversed once.
+
+    :param path:            The path from were to open the images.
+                            String and java.io.File are allowed.
+    :param file_type:       Only accept files with the given extension
+                            (default: None).
+    :param name_filters:    List of name filters, see filter_directory
+                            (default: a single filter accepting all files).
+                            A dict maps arbitrary keys to name filters.
+    :param recursive:       Also search all sub directories (default: True).
+    :param follow_links:    Also search symbolic links to directories
+                            (default: True), see filter_directory.
+    :return:                list of path lists, in order of name_filters,
+                            or a dict with the keys of name_filters
+    """
+    if isinstance(name_filters, dict):
+        keys = list(name_filters)
+        return dict(zip(keys, filter_directory_multi(
+            path, file_type, [name_filters[key] for key in keys], recursive,
+            follow_links)))
+
+    check_filters = [_make_filter_check(name_filter)
+                     for name_filter in name_filters]
+
+    # We collect the matching files of each filter in its own list, the
+    # traversal keeps only files of the given types.
+    path_lists = [[] for _ in check_filters]
+    for entry in _iter_files(_canon_path(path), recursive, follow_links,
+                             _file_suffixes(file_type)):
+        name = entry.name
+        for check_filter, path_list in zip(check_filters, path_lists):
+            if check_filter is _accept_all or check_filter(name):
+                path_list.append(entry.path)
+    return path_lists
+
+
+def _canon_path(path):
+    """Converts the directory argument to a string and expands it.
+
+    :param path:    String or java.io.File
+    :return:        string
+    """
     # Converting a File object to a string.
     if isinstance(path, File):
         path = path.getAbsolutePath()
 
-    def check_type(string):
-        """This function is used to check the file type.
-        It is possible to use a single string or a list/tuple of strings as
-        filter. This function can access the variables of the surrounding
-        function.
-        :param string: The filename to perform the check on.
-        """
-        if file_type:
-            # The first branch is used if file_type is a list or a tuple.
-            if isinstance(file_type, (list, tuple)):
-                for file_type_ in file_type:
-                    if string.endswith(file_type_):
-                        # Exit the function with True.
-                        return True
-                    else:
-                        # Next iteration of the for loop.
-                        continue
-            # The second branch is used if file_type is a string.
-            elif isinstance(file_type, string):
-                if string.endswith(file_type):
-                    return True
-                else:
-                    return False
-            return False
-        # Accept all files if file_type is None.
-        else:
-            return True
-
-    def check_filter(string):
-        """This function is used to check for a given filter.
-        It is possible to use a single string or a list/tuple of strings as filter.
-        This function can access the variables of the surrounding function.
-        :param string: The filename to perform the filtering on.
-        """
-        if name_filter:
-            # The first branch is used if name_filter is a list or a tuple.
-            if isinstance(name_filter, (list, tuple)):
-                for name_filter_ in name_filter:
-                    if name_filter_ in string:
-                        # Exit the function with True.
-                        return True
-                    else:
-                        # Next iteration of the for loop.
-                        continue
-            # The second branch is used if name_filter is a string.
-            elif isinstance(name_filter, string):
-                if name_filter in string:
-                    return True
-                else:
-                    return False
-            return False
-        else:
-            # Accept all files if name_filter is None.
-            return True
-
-    # We collect all files to open in a list.
-    path_to_images = []
     # Replacing some abbreviations (e.g. $HOME on Linux).
     path = os.path.expanduser(path)
     path = os.path.expandvars(path)
+    return path
+
+
+# The checks are specialized once per call of the filter functions, instead of
+# branching on the type of the filters for every single filename. File types
+# are tested inline with str.endswith, which accepts the tuple of suffixes
+# natively and only compares the end of the name. Name filters are tested with
+# the bound search method of one compiled pattern.
+
+def _file_suffixes(file_type):
+    """Normalizes the file types to lower case extensions with a leading dot,
+    e.g. 'TIF' to '.tif'. Names are compared in lower case, so 'IMG.TIF'
+    matches too, and 'motif' doesn't match 'tif'.
+
+    :param file_type:   see filter_directory
+    :return:            tuple of suffixes, empty to accept all files
+    """
+    return tuple(file_type_.lower() if file_type_.startswith('.')
+                 else '.' + file_type_.lower()
+                 for file_type_ in _as_tuple(file_type))
+
+
+def _accept_all(string):
+    """The check used for empty filters, callers may test for identity to skip
+    the call completely.
+    """
+    return True
+
+
+def _make_filter_check(name_filter):
+    """Creates the check for a single name filter.
+
+    :param name_filter: see filter_directory
+    :return:            function, which accepts a filename and returns a
+                        true value if the filename contains any of the
+                        filter strings
+    """
+    pattern = _filter_pattern(name_filter)
+    if not pattern:
+        # Accept all files if name_filter is None.
+        return _accept_all
+    return pattern.search
+
+
+def _filter_pattern(name_filter):
+    """Compiles a name filter to a single pattern, which searches all keywords
+    in one call.
+
+    :param name_filter: see filter_directory
+    :return:            compiled pattern, None if no filter is given
+    """
+    name_filter = _as_tuple(name_filter)
+    if not name_filter:
+        return None
+    return re.compile('|'.join(
+        re.escape(name_filter_) for name_filter_ in name_filter))
+
+
+def pair_originals(image_paths, original_paths, image_filter,
+                   original_filter):
+    """Pairs each image with its original by directory and file name
+
+    An original in the same directory as the image is preferred, so sub
+    directories with the same file names (e.g. one per experiment) are
+    paired separately. Otherwise an original with the same name anywhere is
+    used, but only if it is unique. Uses dict lookups only, see
+    make_pairing_key. Images without an original and ambiguous originals
+    are reported to the console.
+
+    :param image_paths:     list of image paths
+    :param original_paths:  list of original paths
+    :param image_filter:    name filter of the images
+    :param original_filter: name filter of the originals
+    :return:                dict image path -> original path, images without
+                            original are missing
+    """
+    image_key       = make_pairing_key(image_filter)
+    original_key    = make_pairing_key(original_filter)
+
+    originals_by_dir = {}           # (directory, key) -> original path
+    originals_by_key = {}           # key -> list of original paths
+    for path in original_paths:
+        key = original_key(path)
+        dir_key = (os.path.dirname(path), key)
+        if dir_key in originals_by_dir:     # keep the first in sorted order
+            print('Ambiguous originals, using %s instead of %s'
+                  % (originals_by_dir[dir_key], path))
+            continue
+        originals_by_dir[dir_key] = path
+        originals_by_key.setdefault(key, []).append(path)
+
+    originals = {}
+    for path in image_paths:
+        key = image_key(path)
+        original_path = originals_by_dir.get((os.path.dirname(path), key))
+        if not original_path:
+            candidates = originals_by_key.get(key, ())
+            if len(candidates) == 1:    # only if unique in all directories
+                original_path = candidates[0]
+            elif candidates:
+                print('Ambiguous originals for %s in: %s'
+                      % (path, ', '.join(candidates)))
+                continue
+        if original_path:
+            originals[path] = original_path
+        else:
+            print('No original found for: %s' % path)
+    return originals
+
+
+def make_pairing_key(name_filter):
+    """Creates the key to pair images with their originals
+
+    Images and originals follow the same naming scheme and only differ in the
+    filter keyword (and possibly the file type), e.g. 'proc_01.tif' and
+    'orig_01.tif'.
+
+    :param name_filter: see filter_directory
+    :return:            function, which maps a path to its file name without
+                        extension and first filter keyword, the directory
+                        is compared by pair_originals
+    """
+    pattern = _filter_pattern(name_filter)
+
+    def pairing_key(path):
+        stem = os.path.splitext(os.path.basename(path))[0]
+        return pattern.sub('', stem, 1) if pattern else stem
+    return pairing_key
+
 
-    # Each iteration of the for loop processes a different directory.
-    for directory, dir_names, file_names in os.walk(path):
-        # We are only interested in files.
-        for file_name in file_names:
-            # add full path to list only for matching files
-            if check_type(file_name) and check_filter(file_name):
-                full_path = os.path.join(directory, file_name)
-                path_to_images.append(full_path)
-    return path_to_images
+class _FileEntry(object):
+    """Name and path of a file found by Files.walkFileTree, the path string
+    is only built on first access, so files rejected by all name filters of
+    filter_directory_multi never pay for it.
+    """
+    __slots__ = ('name', '_nio_path', '_path')
+
+    def __init__(self, nio_path, name):
+        self.name       = name
+        self._nio_path  = nio_path
+        self._path      = None
+
+    @property
+    def path(self):
+        if self._path is None:
+            self._path = self._nio_path.toString()
+        return self._path
+
+
+class _FileCollector(SimpleFileVisitor):
+    """Collects an entry for every matching file visited by
+    Files.walkFileTree
+
+    The file attributes are read by the JVM during the walk, so no further
+    stat call from Jython is needed per file. Files are checked while they
+    are visited and only matching ones are kept. Every directory is visited
+    only once, the JVM itself only detects links to a parent directory, but
+    not a directory linked twice from different branches.
+
+    :param suffixes:    lower case extensions to accept, empty for all
+    :param check_name:  callable testing a file name, see _make_filter_check
+    """
+
+    def __init__(self, suffixes=(), check_name=None):
+        self.entries    = []
+        self.visited    = set()         # file keys of visited directories
+        self.suffixes   = suffixes
+        self.check_name = None if check_name is _accept_all else check_name
+
+    def preVisitDirectory(self, nio_path, attrs):
+        key = attrs.fileKey()           # (device, inode), None on Windows
+        if key is None:
+            try:
+                key = nio_path.toRealPath().toString()
+            except IOException:
+                return FileVisitResult.CONTINUE
+        if key in self.visited:
+            return FileVisitResult.SKIP_SUBTREE
+        self.visited.add(key)
+        return FileVisitResult.CONTINUE
+
+    def visitFile(self, nio_path, attrs):
+        # symbolic links to files are accepted like in os.walk
+        if not (attrs.isRegularFile() or (attrs.isSymbolicLink()
+                                          and Files.isRegularFile(nio_path))):
+            return FileVisitResult.CONTINUE
+        name = nio_path.getFileName().toString()
+        # cheapest check first, empty filters don't call anything
+        if self.suffixes and not name.lower().endswith(self.suffixes):
+            return FileVisitResult.CONTINUE
+        if self.check_name is None or self.check_name(name):
+            self.entries.append(_FileEntry(nio_path, name))
+        return FileVisitResult.CONTINUE
+
+    def visitFileFailed(self, nio_path, exc):
+        return FileVisitResult.CONTINUE     # skip unreadable like os.walk
+
+    def postVisitDirectory(self, nio_path, exc):
+        # the default rethrows errors while listing a directory, e.g. a
+        # dropped network share, keep the files found so far instead
+        return FileVisitResult.CONTINUE
+
+
+def _iter_files(path, recursive=True, follow_links=True, suffixes=(),
+                check_name=None):
+    """Traverses the directory and yields an entry for every matching file.
+
+    Jython 2.7 has no os.scandir, so the JVM walks the tree and reads the
+    file attributes, no additional stat call per file is needed. Like
+    os.walk, unreadable directories are skipped. Directories reached by
+    several links are scanned only once, see _FileCollector. The whole tree
+    is walked before the first entry is yielded, but only the entries of
+    matching files are kept.
+
+    :param path:        The directory to scan.
+    :param recursive:   Also scan all sub directories (default: True).
+    :param follow_links: Also scan symbolic links to directories
+                        (default: True).
+    :param suffixes:    Only keep files with one of the lower case
+                        extensions (default: all files).
+    :param check_name:  Only keep files whose name passes this check
+                        (default: all files).
+    """
+    options = EnumSet.of(FileVisitOption.FOLLOW_LINKS) if follow_links \
+        else EnumSet.noneOf(FileVisitOption)
+    collector = _FileCollector(suffixes, check_name)
+    Files.walkFileTree(Paths.get(path), options,
+                       Integer.MAX_VALUE if recursive else 1, collector)
+    for entry in collector.entries:
+        yield entry
+
+
+def _as_tuple(value):
+    """Normalizes a filter argument to a tuple of strings.
+
+    :param value:   None, a string separated by ; or a list/tuple of strings
+    :return:        tuple, empty if no filter is given
+    """
+    if not value:
+        return ()
+    if isinstance(value, (list, tuple)):
+        return tuple(string for string in value if string)
+    if isinstance(value, basestring):   # str and unicode in Jython 2.7
+        return split_string(value)
+    raise TypeError('Filters must be strings or lists/tuples of strings, '
+                    'not %s' % type(value).__name__)
 
 
 def split_string(input_string):
-    """Split a string separated by ; to a list and strip it
+    """Split a string separated by ; to a tuple and strip it
+
+    Empty entries (e.g. 'tif;;png') are dropped, an empty string would
+    match every file name.
     """
-    string_splitted = input_string.split(';')
     # Remove whitespace at the beginning and end of each string
-    strings_striped = [string.strip() for string in string_splitted]
-    return strings_striped
+    return tuple(string.strip() for string in input_string.split(';')
+                 if string.strip())
 
 
-def let_user_select_ROI_and_measure(measure_i):
+def let_user_select_ROI_and_measure(measure_i, imp):
 
-    img_ref = WM.getCurrentImage()      # save reference before user choice
+    was_open = is_displayed(imp)        # False if skipped in a prior measure
 
     frame_title = "Proceed...?"         # plugin holds loop until on-click
     frame_text  = "Select ROI or skip image by closing it and click OK"
     WaitForUserDialog(frame_title, frame_text).show()
 
-    if WM.getCurrentImage():
+    if is_displayed(imp):
         # only if image is open
-        IJ.run(img_ref, "Measure", "")
-    elif img_ref:
-        print('Skipped measure %s of: %s' % (str(measure_i+1), img_ref))
+        measure(imp)
+    elif was_open:
+        print('Skipped measure %s of: %s' % (str(measure_i+1),
+                                             imp.getTitle()))
     else:
         print('Skipped measure %s of: s.a.' % str(measure_i + 1))
 
 
+def is_displayed(imp):
+    """Checks if the image is still shown, i.e. the user didn't close it
+
+    :param imp:     ImagePlus object
+    :return:        boolean
+    """
+    window = imp.getWindow()
+    return window is not None and window.isVisible()
+
+
+def measure(imp):
+    """Measures the current selection of an image in batch mode
+
+    The dialog before has to run outside of batch mode, because the user needs
+    the displayed image to select a ROI. Only the measurement itself skips
+    the repaint of the image and the UI updates.
+
+    :param imp:     ImagePlus object to measure
+    :return:        None
+    """
+    batch_mode = Interpreter.batchMode
+    Interpreter.batchMode = True
+    try:
+        IJ.run(imp, "Measure", "")
+    finally:
+        Interpreter.batchMode = batch_mode
+
+
+def find_roi_file(image_path):
+    """Looks for saved ROIs next to an image
+
+    A single ROI has to be saved as '<image name>.roi', several ROIs as a ROI
+    set '<image name>.zip', both without the image extension.
+
+    :param image_path:  path of the image
+    :return:            path of the ROI file or None
+    """
+    stem = os.path.splitext(image_path)[0]
+    for extension in ('.roi', '.zip'):
+        if os.path.isfile(stem + extension):
+            return stem + extension
+    return None
+
+
+def measure_saved_rois(imp, roi_path):
+    """Measures all saved ROIs of an image in batch mode
+
+    The image is never displayed, which skips all window handling.
+
+    :param imp:         ImagePlus object to measure
+    :param roi_path:    path of a .roi file or a .zip ROI set
+    :return:            None
+    """
+    roi_manager = RoiManager(True)      # hidden instance
+    batch_mode = Interpreter.batchMode
+    Interpreter.batchMode = True
+    try:
+        roi_manager.runCommand("Open", roi_path)
+        for roi in roi_manager.getRoisAsArray():
+            imp.setRoi(roi)
+            IJ.run(imp, "Measure", "")
+    finally:
+        Interpreter.batchMode = batch_mode
+        roi_manager.close()
+
+
+_buffered_max_size = 32 * 1024 * 1024  # bytes, larger files are read by seeks
+
+
+def _open_tiff(file_path):
+    # Opener keeps state, so each call gets its own instance, images are
+    # opened in a background thread and by the original button.
+    directory, name = os.path.split(file_path)
+    data = _read_small_file(file_path)
+    if data is None:
+        return Opener().openTiff(directory + os.sep, name)
+
+    imp = Opener().openTiff(ByteArrayInputStream(data), name)
+    file_info = imp.getOriginalFileInfo() if imp else None
+    if file_info:
+        # the stream has no directory, File > Revert and saving need it
+        file_info.directory = directory + os.sep
+    return imp
+
+
+def _read_small_file(file_path):
+    """Reads a file up to _buffered_max_size with one call, the TIFF decoder
+    seeks a lot, which is slow on network drives.
+
+    :return:    byte array, None if the file is larger or can't be read
+    """
+    if File(file_path).length() > _buffered_max_size:
+        return None
+    try:
+        return Files.readAllBytes(Paths.get(file_path))
+    except IOException:
+        return None                     # the path based Opener reports it
+
+
+# readers by lower case extension, which skip the format detection of
+# IJ.openImage(). They report their own errors and return None, a second
+# attempt with IJ.openImage() would only fail and report again.
+_readers = {'.tif': _open_tiff, '.tiff': _open_tiff}
+
+
 def open_image(file_path):
+    reader = _readers.get(os.path.splitext(file_path)[1].lower())
     # IJ.openImage() returns an ImagePlus object or None.
-    imp = IJ.openImage(file_path)
+    imp = reader(file_path) if reader else IJ.openImage(file_path)
     return imp if imp else None     # an object equals true
 
 
+class _PrefetchThreads(ThreadFactory):
+    """Creates named daemon threads for the image prefetch
+
+    Daemon threads don't keep Fiji from exiting, if a run is killed before
+    the executor was shut down.
+    """
+
+    def newThread(self, runnable):
+        thread = Thread(runnable, "autoJ-prefetch")
+        thread.setDaemon(True)
+        return thread
+
+
+class _OpenImage(Callable):
+    """Task to open an image in a background thread
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+
+    def call(self):
+        return open_image(self.file_path)
+
+
+def iter_open_images(paths, prefetch=1):
+    """Opens the images lazily one after another
+
+    Only the image of the current iteration and the next ones are held in
+    memory, instead of opening the whole set up front. The next images are
+    opened in a background thread, while the user measures the current one.
+    Close the generator to stop the thread, if it isn't exhausted.
+
+    :param paths:       iterable of image paths
+    :param prefetch:    number of images opened ahead (default: 1), each
+                        one is held in memory until it's measured
+    :return:            generator of (path, ImagePlus object or None)
+    """
+    executor = Executors.newSingleThreadExecutor(_PrefetchThreads())
+    try:
+        pending = deque()               # (path, future), current image first
+        for path in paths:
+            pending.append((path, executor.submit(_OpenImage(path))))
+            if len(pending) > prefetch:
+                path, future = pending.popleft()
+                yield path, future.get()
+        while pending:
+            path, future = pending.popleft()
+            yield path, future.get()
+    finally:
+        executor.shutdownNow()
+
+
 class ButtonClick(ActionListener):
     """Class which unique function is to handle the button clicks
     For accessibility this class is defined in the same file. It handles the
@@ -210,6 +622,14 @@ class ButtonClick(ActionListener):
         :return:        None
         """
         if self.opened:                 # opens only one image instance
+            if _to_front(self.original_handle):
+                return
+            self.opened = False         # closed by the user, open it again
+        if not self.original_path:      # no matching original
+            return
+
+        # the user may have opened the original already
+        if _to_front(_find_open_image(self.original_path)):
             return
 
         self.original_handle = open_image(self.original_path)
@@ -221,9 +641,192 @@ class ButtonClick(ActionListener):
         self.original_handle.show()
         self.opened = True              # allows closing before advancing
 
+    def close_original(self):
+        """closes the original opened for the current image
 
-def print_console_notes():
-    """Display notes on usage to console
+        :return:        None
+        """
+        if self.original_handle:
+            self.original_handle.close()
+            self.original_handle.flush()    # release pixel data immediately
+            self.original_handle = None
+        self.opened = False
+
+
+def _find_open_image(file_path):
+    """Looks for an open image loaded from the given file
+
+    Titles aren't unique, originals of the same name may exist in several
+    folders, so the file of every open image is compared.
+
+    :param file_path:   path of the image file
+    :return:            ImagePlus object or None
+    """
+    file_path = os.path.normcase(os.path.normpath(file_path))
+    for image_id in WM.getIDList() or ():   # None if no image is open
+        imp = WM.getImage(image_id)
+        file_info = imp.getOriginalFileInfo() if imp else None
+        if not file_info or not file_info.directory or not file_info.fileName:
+            continue                        # e.g. a new, unsaved image
+        open_path = os.path.join(file_info.directory, file_info.fileName)
+        if os.path.normcase(os.path.normpath(open_path)) == file_path:
+            return imp
+    return None
+
+
+def _to_front(imp):
+    """Brings the window of an image to the front
+
+    :param imp:     ImagePlus object or None
+    :return:        True if the image is displayed
+    """
+    window = imp.getWindow() if imp else None
+    if window is None:
+        return False
+    window.toFront()
+    return True
+
+
+class ResultsExport(object):
+    """Appends the measurements of a run to a csv file
+
+    New rows of the ImageJ results table are written and flushed after each
+    image, so the values of a killed or crashed run aren't lost. Exported
+    rows are tracked by position, only the last exported row is read again to
+    detect deletions. After a deletion the table is searched backwards for
+    the last exported rows, so a row the user deleted and measured again is
+    exported too. If none of them is left, e.g. after 'Clear Results', the
+    whole table is exported again. Rows of the table from before the run
+    aren't exported. Rows deleted from the table after they were written
+    stay in the file.
+    """
+    tail_size = 8               # last exported rows kept to find the position
+
+    def __init__(self, path):
+        """opens the file for appending
+
+        :param path:    path of the csv file, created if missing
+        :return:        None
+        """
+        table = ResultsTable.getResultsTable()
+        self.path       = path
+        # an empty file is left by a run without any measurement
+        self.header     = os.path.isfile(path) and os.path.getsize(path) > 0
+        self.numbered   = _is_numbered(table.getColumnHeadings())
+        self.written    = table.size()          # rows before the run
+        self.tail       = deque(maxlen=self.tail_size)  # last exported
+        if self.written:
+            self.tail.append(self._row(table, self.written - 1))
+        self.writer     = BufferedWriter(FileWriter(path, True))
+
+    def write_new_rows(self):
+        """writes all rows added to the results table since the last call
+
+        :return:        None
+        """
+        table = ResultsTable.getResultsTable()
+        headings = table.getColumnHeadings()
+        self.numbered = _is_numbered(headings)
+        size = table.size()
+        start = self._first_new_row(table, size)
+        if start >= size:
+            self.written = size
+            return
+
+        if not self.header:
+            self._write_line(self._split(headings, self.numbered))
+            self.header = True
+        for row in range(start, size):
+            fields = self._row(table, row)
+            self._write_line(fields)
+            self.tail.append(fields)
+        self.written = size
+        self.writer.flush()
+
+    def _first_new_row(self, table, size):
+        # usual case, nothing deleted: the last exported row is unchanged
+        if not self.tail or (0 < self.written <= size and self._row(
+                table, self.written - 1) == self.tail[-1]):
+            return self.written
+        # rows were deleted, the new rows follow the last exported row
+        # which is still in the table
+        for row in range(min(size, self.written) - 1, -1, -1):
+            if self._row(table, row) in self.tail:
+                return row + 1
+        # all known rows deleted, e.g. by 'Clear Results', a row written
+        # twice is better than a lost one
+        return 0
+
+    def _row(self, table, row):
+        return self._split(table.getRowAsString(row), self.numbered)
+
+    @staticmethod
+    def _split(line, numbered):
+        # ImageJ separates the columns with tabs, the row numbers change
+        # when rows are deleted and aren't exported
+        fields = tuple(line.split('\t'))
+        return fields[1:] if numbered else fields
+
+    def _write_line(self, fields):
+        self.writer.write(','.join(_csv_field(field) for field in fields))
+        self.writer.newLine()
+
+    def close(self):
+        """closes the file
+
+        :return:        None
+        """
+        self.writer.close()
+        print('Exported results to: %s' % self.path)
+
+
+def _is_numbered(headings):
+    """Checks if the results table shows row numbers, their heading is empty
+    """
+    return headings.startswith(' \t')
+
+
+def _csv_field(field):
+    """Quotes a field, if it contains a separator, a quote or a line break
+    e.g. a label with the title 'a,b.tif'.
+    """
+    if any(char in field for char in ',"\r\n'):
+        return '"%s"' % field.replace('"', '""')
+    return field
+
+
+def set_nio_buffer_size(size):
+    """Reduces the default buffer of Bio-Formats file handles
+
+    Bio-Formats allocates a 1 MiB buffer for every opened file, which
+    dominates the time to open many small images, especially on network
+    drives. Buffers as small as 16 bytes were measured fastest on SMB shares,
+    the default of the dialog (8192) keeps large local reads efficient. The
+    setting is global for the whole Fiji session, so the caller restores the
+    returned size after the run. Without Bio-Formats this has no effect.
+
+    :param size:    buffer size in bytes, 0 keeps the current size
+    :return:        the previous size, None if nothing was changed
+    """
+    if size <= 0:
+        return None
+    try:
+        from loci.common import NIOFileHandle
+    except ImportError:
+        return None
+    try:
+        # the field is protected and has no getter
+        field = NIOFileHandle.getDeclaredField('defaultBufferSize')
+        field.setAccessible(True)
+        previous = field.getInt(None)
+    except (NoSuchFieldException, SecurityException):
+        return None     # a size that can't be restored is never changed
+    NIOFileHandle.setDefaultBufferSize(size)
+    return previous
+
+
+def _build_console_notes():
+    """Composes the notes on usage, printed by print_console_notes
     """
     line        = "_"*114
     greet       = "PLEASE NOTE:"
@@ -236,10 +839,19 @@ def print_console_notes():
     back_to_img = "In case you wish to return to it later:\nCopy the file " \
                   "name from the console, rerun the script and paste it into " \
                   "the filter dialog. "
-    print('\n\n'.join(
+    return '\n\n'.join(
                 [line,
                  greet, execution, skip_img, back_to_img,
-                 line]))
+                 line])
+
+
+_console_notes = _build_console_notes()     # composed once on import
+
+
+def print_console_notes():
+    """Display notes on usage to console
+    """
+    print(_console_notes)
 
 
 def print_filter_error(file_types, filters):
@@ -255,76 +867,112 @@ def run_script():
 
     :return: boolean    True if successful, False if execution failed
     """
+    gc_interval = 16            # images between explicit garbage collections
+    prefetch    = 1             # images opened ahead, held in memory
+    export_name = 'autoJ_results.csv'
 
     """ Filtering and creation of additional ui elements 
     """
-    path_list_images = filter_directory(import_dir,
+    name_filters = {'measure': filters_measure}
+    if allow_orig:                              # do the same for originals
+        name_filters['original'] = filters_original
+
+    search_dir = _canon_path(import_dir)        # convert the File only once
+    path_lists = filter_directory_multi(search_dir,     # single traversal
                                         file_types,
-                                        filters_measure)
+                                        name_filters)
+    for path_list in path_lists.values():
+        # group by directory and pair by file name instead of traversal order
+        path_list.sort(key=os.path.split)
+    path_list_images = path_lists['measure']
 
     if not path_list_images:
         print_filter_error(file_types,
                            filters_measure)
         return False                            # exit without matching images
 
-    if allow_orig:                              # do the same for originals
-        path_list_originals = filter_directory(import_dir,
-                                               file_types,
-                                               filters_original)
+    if allow_orig:
+        path_list_originals = path_lists['original']
         if not path_list_originals:
             print_filter_error(file_types,
                                filters_original)
             return False
 
-        frame           = JFrame("Open Original Image",
-                                 visible=True, size=(500, 125))
+        # pair by file name without filter keyword, instead of list position
+        originals = pair_originals(path_list_images, path_list_originals,
+                                   filters_measure, filters_original)
+
+        frame           = JFrame("Open Original Image", size=(500, 125))
         button          = JButton("Open Original")
         button_event    = ButtonClick()
 
         button.addActionListener(button_event)
         frame.getContentPane().add(button)
         frame.pack()                            # created UI elements
-    else:
-        # has no effect, but avoids referencing before assignment
-        path_list_originals = path_list_images
+        frame.setVisible(True)                  # show only once laid out
 
     print_console_notes()
 
     """ Execution loop
     """
-    for image_path, original_path in zip(path_list_images, path_list_originals):
-
-        image = open_image(image_path)
-
-        if not image:
-            print('Could not create an ImagePlus object from: %s'
-                  % str(image_path))
-            return False
-
-        image.show()                                    # for ROI selection
-
+    export = None
+    images = iter_open_images(path_list_images, prefetch)
+    try:
+        if do_export:                           # appends after each image
+            export_path = os.path.join(search_dir, export_name)
+            try:
+                export = ResultsExport(export_path)
+            except IOException as error:
+                print('Could not open the export file %s:\n%s'
+                      % (export_path, error))
+                return False
+
+        for image_i, (image_path, image) in enumerate(images):
+
+            if not image:                       # e.g. corrupt or mislabeled
+                print('Skipped image, could not create an ImagePlus object '
+                      'from: %s' % str(image_path))
+                continue
+
+            if allow_orig:                      # also while measured in batch
+                button_event.set_original(originals.get(image_path))
+
+            roi_path = find_roi_file(image_path) if do_batch else None
+            if roi_path:
+                measure_saved_rois(image, roi_path)     # no user interaction
+            else:
+                image.show()                            # for ROI selection
+                for i in range(measurements):
+                    let_user_select_ROI_and_measure(i, image)
+
+            if export:
+                export.write_new_rows()                 # before next image
+            image.close()                               # close before next
+            image.flush()                               # release pixel data
+            if allow_orig:
+                button_event.close_original()           # before next
+            if (image_i + 1) % gc_interval == 0:
+                System.gc()                             # compact the heap
+    finally:
+        """ Post processing - UI disposal, also if the run failed
+        """
+        images.close()                          # stops the prefetch
+        if export:
+            export.close()
         if allow_orig:
-            button_event.set_original(original_path)    # allows opening
-
-        for i in range(measurements):
-            let_user_select_ROI_and_measure(i)
-
-        image.close()                                   # close before next
-        if allow_orig and button_event.opened:
-            button_event.original_handle.close()
-
-    """ Post processing - export and UI disposal
-    """
-    if do_export:
-        print('here comes the export')
-    if allow_orig:
-        frame.dispose()
+            button_event.close_original()
+            frame.dispose()                     # releases the Swing peers
 
     return True
 
 
 if __name__ in ['__builtin__', '__main__']:
-    val = run_script()
+    buffer_size_prior = set_nio_buffer_size(buffer_size)   # before opening
+    try:
+        val = run_script()
+    finally:
+        if buffer_size_prior is not None:   # leave the session as it was
+            set_nio_buffer_size(buffer_size_prior)
 
     msg_done    = '\n...finished autoJ.'
     msg_cancel  = '\n...Script was cancelled.'
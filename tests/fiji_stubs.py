@@ -0,0 +1,34 @@
+"""Imports autoJ outside of Fiji
+
+autoJ.py imports java and ImageJ classes, which only exist in Fiji's Jython.
+The modules are replaced by stubs before the import. Python 3 lacks the
+Jython 2.7 builtin basestring, autoJ gets str instead.
+"""
+
+import os
+import sys
+import types
+
+
+def _install_stub_modules():
+    """Registers empty java and ImageJ modules, every attribute is a class"""
+    class StubModule(types.ModuleType):
+        def __getattr__(self, name):
+            stub = type(name, (object,), {})
+            setattr(self, name, stub)
+            return stub
+
+    for name in ('java', 'java.awt', 'java.awt.event', 'java.io',
+                 'java.lang', 'java.nio', 'java.nio.file', 'java.util',
+                 'java.util.concurrent', 'javax', 'javax.swing', 'ij',
+                 'ij.gui', 'ij.io', 'ij.macro', 'ij.measure', 'ij.plugin',
+                 'ij.plugin.frame'):
+        sys.modules.setdefault(name, StubModule(name))
+
+
+_install_stub_modules()
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import autoJ    # noqa: E402
+
+if sys.version_info[0] > 2:
+    autoJ.basestring = str
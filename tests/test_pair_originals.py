@@ -0,0 +1,63 @@
+"""Tests of the pairing of images with their originals, run outside of Fiji
+"""
+
+import contextlib
+import io
+import unittest
+
+from fiji_stubs import autoJ
+
+
+class TestPairOriginals(unittest.TestCase):
+
+    def pair(self, image_paths, original_paths):
+        """pairs with the filters 'proc_' and 'orig_'
+
+        :return:    dict image path -> original path, console output
+        """
+        console = io.StringIO()
+        with contextlib.redirect_stdout(console):
+            originals = autoJ.pair_originals(image_paths, original_paths,
+                                             'proc_', 'orig_')
+        return originals, console.getvalue()
+
+    def test_same_names_in_two_sub_directories(self):
+        originals, console = self.pair(
+            ['/data/exp1/proc_01.tif', '/data/exp2/proc_01.tif'],
+            ['/data/exp1/orig_01.tif', '/data/exp2/orig_01.tif'])
+        self.assertEqual(originals,
+                         {'/data/exp1/proc_01.tif': '/data/exp1/orig_01.tif',
+                          '/data/exp2/proc_01.tif': '/data/exp2/orig_01.tif'})
+        self.assertEqual(console, '')
+
+    def test_original_in_another_folder(self):
+        originals, console = self.pair(
+            ['/data/processed/proc_01.tif'],
+            ['/data/originals/orig_01.png'])
+        self.assertEqual(originals, {'/data/processed/proc_01.tif':
+                                     '/data/originals/orig_01.png'})
+        self.assertEqual(console, '')
+
+    def test_two_candidate_originals(self):
+        originals, console = self.pair(
+            ['/data/processed/proc_01.tif'],
+            ['/data/exp1/orig_01.tif', '/data/exp2/orig_01.tif'])
+        self.assertEqual(originals, {})
+        self.assertIn('Ambiguous originals for /data/processed/proc_01.tif',
+                      console)
+        self.assertIn('/data/exp1/orig_01.tif, /data/exp2/orig_01.tif',
+                      console)
+        self.assertNotIn('No original found', console)
+
+    def test_image_without_original(self):
+        originals, console = self.pair(
+            ['/data/exp1/proc_01.tif', '/data/exp1/proc_02.tif'],
+            ['/data/exp1/orig_01.tif'])
+        self.assertEqual(originals,
+                         {'/data/exp1/proc_01.tif': '/data/exp1/orig_01.tif'})
+        self.assertEqual(console,
+                         'No original found for: /data/exp1/proc_02.tif\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+"""Tests of the csv export, run outside of Fiji
+
+The results table and the java writers are replaced by small Python
+classes, see fiji_stubs for the other java and ImageJ classes.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from fiji_stubs import autoJ
+
+
+class StubResultsTable(object):
+    """Results table with row numbers, formatted like ImageJ's"""
+    instance = None
+
+    def __init__(self):
+        self.rows = []
+
+    @classmethod
+    def getResultsTable(cls):
+        return cls.instance
+
+    def size(self):
+        return len(self.rows)
+
+    def getColumnHeadings(self):
+        return ' \tLabel\tMean'
+
+    def getRowAsString(self, row):
+        if not 0 <= row < len(self.rows):   # no negative indices in ImageJ
+            raise ValueError('Row out of range')
+        return '\t'.join((str(row + 1),) + self.rows[row])
+
+    def measure(self, label, mean):
+        self.rows.append((label, str(mean)))
+
+    def clear(self):
+        del self.rows[:]
+
+
+class StubWriter(object):
+    """BufferedWriter(FileWriter(path, True)) on a Python file"""
+
+    def __init__(self, path, append=True):
+        self.file = open(path, 'a' if append else 'w')
+
+    def write(self, string):
+        self.file.write(string)
+
+    def newLine(self):
+        self.file.write('\n')
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class TestResultsExport(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'autoJ_results.csv')
+        self.table = StubResultsTable.instance = StubResultsTable()
+        self.patched = dict((name, getattr(autoJ, name)) for name in
+                            ('ResultsTable', 'BufferedWriter', 'FileWriter'))
+        autoJ.ResultsTable = StubResultsTable
+        autoJ.FileWriter = StubWriter
+        autoJ.BufferedWriter = lambda writer: writer
+
+    def tearDown(self):
+        for name, value in self.patched.items():
+            setattr(autoJ, name, value)
+        shutil.rmtree(self.directory)
+
+    def exported(self, export):
+        export.close()
+        with open(self.path) as csv_file:
+            return csv_file.read().splitlines()
+
+    def test_new_rows_are_exported_once(self):
+        export = autoJ.ResultsExport(self.path)
+        self.table.measure('a.tif', 1)
+        self.table.measure('a.tif', 2)
+        export.write_new_rows()
+        self.table.measure('b.tif', 3)
+        export.write_new_rows()
+        export.write_new_rows()
+        self.assertEqual(self.exported(export),
+                         ['Label,Mean', 'a.tif,1', 'a.tif,2', 'b.tif,3'])
+
+    def test_header_after_a_run_without_rows(self):
+        self.exported(autoJ.ResultsExport(self.path))   # nothing measured
+        export = autoJ.ResultsExport(self.path)
+        self.table.measure('a.tif', 1)
+        export.write_new_rows()
+        self.assertEqual(self.exported(export), ['Label,Mean', 'a.tif,1'])
+
+    def test_clear_results_then_measure(self):
+        export = autoJ.ResultsExport(self.path)
+        for label, mean in (('a.tif', 1), ('a.tif', 2),
+                            ('b.tif', 3), ('b.tif', 4)):
+            self.table.measure(label, mean)
+        export.write_new_rows()
+        self.table.clear()                  # 'Clear Results'
+        self.table.measure('c.tif', 5)
+        export.write_new_rows()
+        self.table.measure('d.tif', 6)
+        self.table.measure('d.tif', 7)
+        export.write_new_rows()
+        self.assertEqual(self.exported(export)[5:],
+                         ['c.tif,5', 'd.tif,6', 'd.tif,7'])
+
+    def test_clear_results_then_measure_more_rows_than_before(self):
+        export = autoJ.ResultsExport(self.path)
+        self.table.measure('a.tif', 1)
+        self.table.measure('a.tif', 2)
+        export.write_new_rows()
+        self.table.clear()
+        for mean in range(3, 8):
+            self.table.measure('b.tif', mean)
+        export.write_new_rows()
+        self.assertEqual(self.exported(export)[3:],
+                         ['b.tif,%d' % mean for mean in range(3, 8)])
+
+    def test_clear_results_then_skip_then_measure(self):
+        export = autoJ.ResultsExport(self.path)
+        self.table.measure('a.tif', 1)
+        export.write_new_rows()
+        self.table.clear()
+        export.write_new_rows()             # image closed without measuring
+        self.table.measure('c.tif', 2)
+        export.write_new_rows()
+        self.assertEqual(self.exported(export),
+                         ['Label,Mean', 'a.tif,1', 'c.tif,2'])
+
+    def test_deleted_and_measured_again(self):
+        export = autoJ.ResultsExport(self.path)
+        self.table.measure('a.tif', 1)
+        self.table.measure('a.tif', 2)
+        export.write_new_rows()
+        del self.table.rows[1]              # correction by the user
+        self.table.measure('a.tif', 3)
+        export.write_new_rows()
+        self.assertEqual(self.exported(export)[1:],
+                         ['a.tif,1', 'a.tif,2', 'a.tif,3'])
+
+
+if __name__ == '__main__':
+    unittest.main()